@@ -13,14 +13,36 @@ DEFAULT_LLM_PROVIDER = "groq"  # "groq", "openai", or "anthropic"
 OPENAI_MODEL = "gpt-4o"  # or "gpt-4-turbo-preview"
 ANTHROPIC_MODEL = "claude-3-opus-20240229"
 GROQ_MODEL = "groq/compound"
+MAX_CONCURRENT_REQUESTS = 5  # Max parallel LLM calls per worker process
+LLM_TIMEOUT = 120  # Seconds before an LLM request times out
+LLM_MAX_ATTEMPTS = 5  # Attempts per LLM call on rate limits, timeouts and 5xx errors
+
+# Batched Extraction Configuration
+BATCH_MAX_PAGES = 8  # Documents with more pages are processed per page
+BATCH_MAX_INPUT_TOKENS = 6000  # Larger batches fall back to per-page calls
+BATCH_OUTPUT_TOKEN_RATIO = 3  # Estimated JSON output tokens per input token of page text
+# Completion budget for batched calls, capped by each provider's model output limit
+BATCH_MAX_COMPLETION_TOKENS = {
+    "groq": 8192,
+    "openai": 4096,
+    "anthropic": 4096,
+}
+
+# Response Cache Configuration
+RESPONSE_CACHE_SIZE = 1024  # Max cached LLM responses, 0 disables the cache
+RESPONSE_CACHE_TTL = 86400  # Seconds before a cached response expires
 
 # OCR Configuration
 # Auto-detected: /opt/homebrew/Cellar/tesseract/5.5.1/bin/tesseract
 # Will auto-detect if None, or specify custom path
 TESSERACT_CMD = None  # Auto-detect, or set to specific path like "/opt/homebrew/bin/tesseract"
+MIN_TEXT_LAYER_CHARS = 50  # PDF pages with less embedded text than this are OCR'd
+OCR_DPI = 200  # Render resolution for scanned PDF pages
+OCR_BINARIZE_THRESHOLD = 140  # Grayscale cutoff (0-255) for black/white conversion before OCR
 
 # API Configuration
 API_HOST = "0.0.0.0"
 API_PORT = 8000
+API_WORKERS = 2
 
 
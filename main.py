@@ -1,8 +1,10 @@
 """
 FastAPI application for bill extraction
 """
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import uvicorn
@@ -13,7 +15,21 @@ from utils.token_tracker import TokenTracker
 from utils.logger import logger
 import config
 
-app = FastAPI(title="Bill Extraction API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared processors once so API clients keep connections alive across requests"""
+    app.state.doc_processor = DocumentProcessor()
+    app.state.extraction_service = ExtractionService()
+    yield
+    await app.state.extraction_service.close()
+    await app.state.doc_processor.close()
+
+app = FastAPI(
+    title="Bill Extraction API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # CORS middleware
 app.add_middleware(
@@ -53,6 +69,12 @@ class ExtractBillResponse(BaseModel):
     token_usage: TokenUsage
     data: ExtractBillData
 
+def get_doc_processor(request: Request) -> DocumentProcessor:
+    return request.app.state.doc_processor
+
+def get_extraction_service(request: Request) -> ExtractionService:
+    return request.app.state.extraction_service
+
 @app.get("/")
 async def root():
     return {"message": "Bill Extraction API", "status": "running"}
@@ -62,7 +84,11 @@ async def health():
     return {"status": "healthy"}
 
 @app.post("/extract-bill-data", response_model=ExtractBillResponse)
-async def extract_bill_data(request: ExtractBillRequest):
+async def extract_bill_data(
+    request: ExtractBillRequest,
+    doc_processor: DocumentProcessor = Depends(get_doc_processor),
+    extraction_service: ExtractionService = Depends(get_extraction_service)
+):
     """
     Extract line items from bill documents
     """
@@ -71,26 +97,21 @@ async def extract_bill_data(request: ExtractBillRequest):
     try:
         logger.info(f"Received request to process document: {request.document}")
         
-        # Initialize processors
-        doc_processor = DocumentProcessor()
-        extraction_service = ExtractionService(token_tracker)
-        
         # Process document - get pages with text
-        pages = doc_processor.process_document(request.document)
+        pages = await doc_processor.process_document(request.document)
         logger.info(f"Processed {len(pages)} pages from document")
         
-        # Extract line items from each page
-        pagewise_line_items = []
-        total_item_count = 0
-        
+        # Extract line items from all pages, batched into one LLM call where possible
+        text_pages = []
         for page_no, text in pages:
             if not text.strip():
                 logger.warning(f"Page {page_no} has no text, skipping")
                 continue
             
-            page_data = extraction_service.process_page(page_no, text)
-            pagewise_line_items.append(page_data)
-            total_item_count += len(page_data["bill_items"])
+            text_pages.append((page_no, text))
+        
+        pagewise_line_items = await extraction_service.process_document_batched(text_pages, token_tracker)
+        total_item_count = sum(len(page_data["bill_items"]) for page_data in pagewise_line_items)
         
         # Get token usage
         token_usage = token_tracker.get_usage()
@@ -100,8 +121,14 @@ async def extract_bill_data(request: ExtractBillRequest):
             is_success=True,
             token_usage=TokenUsage(**token_usage),
             data=ExtractBillData(
+                # Items are already typed by the extraction service, so skip re-validation
                 pagewise_line_items=[
-                    PageLineItems(**item) for item in pagewise_line_items
+                    PageLineItems.model_construct(
+                        page_no=item["page_no"],
+                        page_type=item["page_type"],
+                        bill_items=[BillItem.model_construct(**b) for b in item["bill_items"]]
+                    )
+                    for item in pagewise_line_items
                 ],
                 total_item_count=total_item_count
             )
@@ -122,7 +149,9 @@ if __name__ == "__main__":
         "main:app",
         host=config.API_HOST,
         port=config.API_PORT,
-        reload=True
+        loop="uvloop",
+        http="httptools",
+        workers=config.API_WORKERS
     )
 
 
@@ -1,83 +1,265 @@
 """
 LLM-based extraction service for bill data
 """
-import json
+import asyncio
+import httpx
+import logging
+import msgspec
 import re
-from typing import List, Dict, Any
-from openai import OpenAI
-from anthropic import Anthropic
-from groq import Groq
+from typing import List, Dict, Any, Optional, Tuple, Type, TypeVar, Union
+import anthropic
+import groq
+import openai
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+from groq import AsyncGroq
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 from utils.logger import logger
 from utils.token_tracker import TokenTracker
+from utils.response_cache import ResponseCache
 import config
 
+PAGE_TYPES = ("Bill Detail", "Final Bill", "Pharmacy")
+DEFAULT_PAGE_TYPE = "Bill Detail"
+
+# Classification and extraction instructions shared by the per-page and batched prompts
+EXTRACTION_INSTRUCTIONS = """You are an expert at extracting structured data from medical bills and invoices.
+First classify the page type as exactly one of these three options:
+- "Bill Detail": Detailed itemized bills with line items
+- "Final Bill": Summary bills with totals
+- "Pharmacy": Pharmacy bills with medication items
+
+Then extract ALL line items from the bill text. For each line item, extract:
+- item_name: The exact name/description as shown in the bill
+- item_amount: The net amount (after discounts) for this line item (float)
+- item_rate: The unit rate/price for this item (float)
+- item_quantity: The quantity of this item (float)
+
+IMPORTANT RULES:
+1. Extract EVERY line item - do not miss any
+2. Do NOT include subtotals or totals as line items
+3. item_amount should be the total for that line (quantity × rate, after discounts)
+4. If quantity is not explicitly mentioned, use 1.0
+5. If rate is not explicitly mentioned but amount and quantity are, calculate rate = amount / quantity
+6. page_type must be one of "Bill Detail", "Final Bill", or "Pharmacy"
+"""
+
+PAGE_SYSTEM_PROMPT = EXTRACTION_INSTRUCTIONS + """7. Return ONLY valid JSON in this exact format (no markdown, no code blocks, just pure JSON):
+{
+  "page_type": "Bill Detail",
+  "bill_items": [
+    {
+      "item_name": "string",
+      "item_amount": 0.0,
+      "item_rate": 0.0,
+      "item_quantity": 1.0
+    }
+  ]
+}"""
+
+BATCH_SYSTEM_PROMPT = EXTRACTION_INSTRUCTIONS + """7. The input contains several pages, each starting with a ===PAGE n=== marker. Classify and extract each page separately
+8. Return ONLY valid JSON in this exact format, with one entry per page (no markdown, no code blocks, just pure JSON):
+{
+  "pages": [
+    {
+      "page_no": "1",
+      "page_type": "Bill Detail",
+      "bill_items": [
+        {
+          "item_name": "string",
+          "item_amount": 0.0,
+          "item_rate": 0.0,
+          "item_quantity": 1.0
+        }
+      ]
+    }
+  ]
+}"""
+
+class BillItemPayload(msgspec.Struct):
+    """A line item as returned by the LLM"""
+    item_name: str = ""
+    # Models often emit null for values missing from the bill
+    item_amount: Optional[float] = None
+    item_rate: Optional[float] = None
+    item_quantity: Optional[float] = None
+
+class PagePayload(msgspec.Struct):
+    """Page type and line items of a single page as returned by the LLM"""
+    page_no: Union[int, str] = ""
+    page_type: Optional[str] = None
+    bill_items: List[BillItemPayload] = []
+
+class BatchPayload(msgspec.Struct):
+    """Pages of a batched extraction as returned by the LLM"""
+    pages: List[PagePayload] = []
+
+PayloadT = TypeVar("PayloadT", PagePayload, BatchPayload)
+
+# The system prompts never change, so their token count only needs computing once. Keeping
+# them byte-identical across calls also lets provider-side prompt caching reuse the prefix.
+BATCH_SYSTEM_PROMPT_TOKENS = TokenTracker.count_tokens_openai(BATCH_SYSTEM_PROMPT)
+
+# Opening (optionally tagged json) and closing markdown code fences
+_CODE_FENCE_RE = re.compile(r'^```(?:json)?\s*|```\s*$')
+
+class TruncatedResponseError(ValueError):
+    """Raised when the LLM stops at its completion token limit, leaving incomplete JSON"""
+
+# Rate limits, timeouts and 5xx responses are worth retrying; other API errors are not
+TRANSIENT_API_ERRORS = (
+    openai.RateLimitError, openai.APITimeoutError,
+    openai.APIConnectionError, openai.InternalServerError,
+    anthropic.RateLimitError, anthropic.APITimeoutError,
+    anthropic.APIConnectionError, anthropic.InternalServerError,
+    groq.RateLimitError, groq.APITimeoutError,
+    groq.APIConnectionError, groq.InternalServerError,
+)
+
+# Retry transient provider errors with jittered exponential backoff
+retry_transient = retry(
+    retry=retry_if_exception_type(TRANSIENT_API_ERRORS),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(config.LLM_MAX_ATTEMPTS),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True,
+)
+
+def _make_http_client() -> httpx.AsyncClient:
+    """HTTP client with a connection pool sized for the parallel page fanout"""
+    return httpx.AsyncClient(
+        timeout=config.LLM_TIMEOUT,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    )
+
+# Shared across requests so duplicate pages skip the LLM call
+response_cache = ResponseCache(
+    max_size=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL
+)
+
 class ExtractionService:
     """Service for extracting structured data from bill text using LLM"""
     
-    def __init__(self, token_tracker: TokenTracker):
-        self.token_tracker = token_tracker
+    def __init__(self):
         self.openai_client = None
         self.anthropic_client = None
         self.groq_client = None
+        # Limit concurrent LLM calls across all requests to respect provider rate limits
+        self.semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_REQUESTS)
         
+        # SDK retries are disabled so retry_transient owns the retry policy
         if config.OPENAI_API_KEY:
-            self.openai_client = OpenAI(api_key=config.OPENAI_API_KEY)
+            self.openai_client = AsyncOpenAI(
+                api_key=config.OPENAI_API_KEY, max_retries=0, http_client=_make_http_client()
+            )
         if config.ANTHROPIC_API_KEY:
-            self.anthropic_client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+            self.anthropic_client = AsyncAnthropic(
+                api_key=config.ANTHROPIC_API_KEY, max_retries=0, http_client=_make_http_client()
+            )
         if config.GROQ_API_KEY:
-            self.groq_client = Groq(api_key=config.GROQ_API_KEY)
+            self.groq_client = AsyncGroq(
+                api_key=config.GROQ_API_KEY, max_retries=0, http_client=_make_http_client()
+            )
     
-    def _call_openai(self, prompt: str, system_prompt: str) -> str:
+    async def close(self):
+        """Close the underlying API clients"""
+        for client in (self.openai_client, self.anthropic_client, self.groq_client):
+            if client:
+                await client.close()
+    
+    @retry_transient
+    async def _call_openai(
+        self, prompt: str, system_prompt: str, token_tracker: TokenTracker, max_tokens: int
+    ) -> str:
         """Call OpenAI API"""
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model=config.OPENAI_MODEL,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
+                max_tokens=max_tokens,
                 response_format={"type": "json_object"}
             )
             
-            # Track tokens
-            input_tokens = self.token_tracker.count_tokens_openai(
-                system_prompt + prompt, config.OPENAI_MODEL
-            )
-            output_tokens = self.token_tracker.count_tokens_openai(
-                response.choices[0].message.content, config.OPENAI_MODEL
-            )
-            self.token_tracker.add_usage(input_tokens, output_tokens)
+            content = response.choices[0].message.content
             
-            return response.choices[0].message.content
+            # Track tokens, counting locally only if the provider omits usage
+            if response.usage:
+                token_tracker.add_usage(
+                    response.usage.prompt_tokens, response.usage.completion_tokens
+                )
+            else:
+                token_tracker.add_usage(*token_tracker.count_tokens_batch(
+                    [system_prompt + prompt, content], config.OPENAI_MODEL
+                ))
+            
+            if response.choices[0].finish_reason == "length":
+                raise TruncatedResponseError(f"Response hit the {max_tokens} token limit")
+            
+            return content
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
             raise
     
-    def _call_anthropic(self, prompt: str, system_prompt: str) -> str:
+    @retry_transient
+    async def _call_anthropic(
+        self, prompt: str, system_prompt: str, token_tracker: TokenTracker, max_tokens: int
+    ) -> str:
         """Call Anthropic API"""
         try:
-            message = f"{system_prompt}\n\n{prompt}"
-            response = self.anthropic_client.messages.create(
+            # The static system prompt is marked cacheable; only the user message varies per page
+            response = await self.anthropic_client.messages.create(
                 model=config.ANTHROPIC_MODEL,
-                max_tokens=4096,
+                max_tokens=max_tokens,
                 temperature=0.1,
-                messages=[{"role": "user", "content": message}]
+                system=[{
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"}
+                }],
+                messages=[{"role": "user", "content": prompt}]
             )
             
             content = response.content[0].text
             
-            # Track tokens (approximate)
-            input_tokens = self.token_tracker.count_tokens_anthropic(message)
-            output_tokens = self.token_tracker.count_tokens_anthropic(content)
-            self.token_tracker.add_usage(input_tokens, output_tokens)
+            # Track tokens, approximating locally only if the provider omits usage
+            if response.usage:
+                usage = response.usage
+                # Cached prompt tokens are reported separately from input_tokens. The pinned
+                # SDK's Usage model does not declare these fields, so read them defensively.
+                input_tokens = (
+                    usage.input_tokens
+                    + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+                    + (getattr(usage, "cache_read_input_tokens", None) or 0)
+                )
+                token_tracker.add_usage(input_tokens, usage.output_tokens)
+            else:
+                token_tracker.add_usage(
+                    token_tracker.count_tokens_anthropic(system_prompt + prompt),
+                    token_tracker.count_tokens_anthropic(content)
+                )
+            
+            if response.stop_reason == "max_tokens":
+                raise TruncatedResponseError(f"Response hit the {max_tokens} token limit")
             
             return content
         except Exception as e:
             logger.error(f"Anthropic API error: {str(e)}")
             raise
     
-    def _call_groq(self, prompt: str, system_prompt: str) -> str:
+    @retry_transient
+    async def _call_groq(
+        self, prompt: str, system_prompt: str, token_tracker: TokenTracker, max_tokens: int
+    ) -> str:
         """Call Groq API"""
         try:
             messages = [
@@ -85,148 +267,238 @@ class ExtractionService:
                 {"role": "user", "content": prompt}
             ]
             
-            completion = self.groq_client.chat.completions.create(
+            stream = await self.groq_client.chat.completions.create(
                 model=config.GROQ_MODEL,
                 messages=messages,
                 temperature=0.1,
-                max_completion_tokens=4096,
+                max_completion_tokens=max_tokens,
                 top_p=1,
-                stream=False,
+                stream=True,
                 stop=None
             )
             
-            content = completion.choices[0].message.content
+            # Accumulate streamed content, stopping early if the reply is clearly not JSON
+            parts = []
+            usage = None
+            finish_reason = None
+            checked_start = False
+            async for chunk in stream:
+                if chunk.x_groq and chunk.x_groq.usage:
+                    usage = chunk.x_groq.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                
+                parts.append(chunk.choices[0].delta.content)
+                if not checked_start:
+                    start = "".join(parts).lstrip()
+                    if start:
+                        checked_start = True
+                        if start[0] not in "{`":
+                            await stream.close()
+                            content = "".join(parts)
+                            token_tracker.add_usage(*token_tracker.count_tokens_batch(
+                                [system_prompt + prompt, content], "gpt-4"
+                            ))
+                            raise ValueError(f"Response is not JSON: {content[:100]}")
             
-            # Track tokens (approximate using tiktoken)
-            input_tokens = self.token_tracker.count_tokens_openai(
-                system_prompt + prompt, "gpt-4"
-            )
-            output_tokens = self.token_tracker.count_tokens_openai(
-                content, "gpt-4"
-            )
-            self.token_tracker.add_usage(input_tokens, output_tokens)
+            content = "".join(parts)
+            
+            # Track tokens, approximating with tiktoken only if the provider omits usage
+            if usage:
+                token_tracker.add_usage(usage.prompt_tokens, usage.completion_tokens)
+            else:
+                token_tracker.add_usage(*token_tracker.count_tokens_batch(
+                    [system_prompt + prompt, content], "gpt-4"
+                ))
+            
+            if finish_reason == "length":
+                raise TruncatedResponseError(f"Response hit the {max_tokens} token limit")
             
             return content
         except Exception as e:
             logger.error(f"Groq API error: {str(e)}")
             raise
     
-    def _call_llm(self, prompt: str, system_prompt: str) -> str:
-        """Call LLM based on configured provider"""
-        if config.DEFAULT_LLM_PROVIDER == "groq" and self.groq_client:
-            return self._call_groq(prompt, system_prompt)
-        elif config.DEFAULT_LLM_PROVIDER == "openai" and self.openai_client:
-            return self._call_openai(prompt, system_prompt)
-        elif config.DEFAULT_LLM_PROVIDER == "anthropic" and self.anthropic_client:
-            return self._call_anthropic(prompt, system_prompt)
-        else:
-            raise ValueError("No valid LLM provider configured")
-    
-    def detect_page_type(self, text: str) -> str:
-        """Detect page type: Bill Detail, Final Bill, or Pharmacy"""
-        system_prompt = """You are a document classification expert. Classify the document type based on the content.
-Return ONLY one of these three options: "Bill Detail", "Final Bill", or "Pharmacy".
-- "Bill Detail": Detailed itemized bills with line items
-- "Final Bill": Summary bills with totals
-- "Pharmacy": Pharmacy bills with medication items"""
+    async def _call_llm(
+        self,
+        prompt: str,
+        system_prompt: str,
+        token_tracker: TokenTracker,
+        payload_type: Type[PayloadT],
+        max_tokens: int = 4096
+    ) -> PayloadT:
+        """
+        Call LLM based on configured provider and decode its JSON reply.
+        Repeats are served from cache; only replies that decode are cached.
+        """
+        provider = config.DEFAULT_LLM_PROVIDER
+        model = {
+            "groq": config.GROQ_MODEL,
+            "openai": config.OPENAI_MODEL,
+            "anthropic": config.ANTHROPIC_MODEL,
+        }.get(provider, "")
+        cache_key = response_cache.make_key(provider, model, system_prompt, prompt)
         
-        prompt = f"""Classify this document:\n\n{text[:2000]}"""
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("LLM response served from cache")
+            return self._parse_json_response(cached, payload_type)
         
-        try:
-            response = self._call_llm(prompt, system_prompt)
-            # Extract classification from response
-            if "Bill Detail" in response:
-                return "Bill Detail"
-            elif "Final Bill" in response:
-                return "Final Bill"
-            elif "Pharmacy" in response:
-                return "Pharmacy"
+        async with self.semaphore:
+            if provider == "groq" and self.groq_client:
+                response = await self._call_groq(prompt, system_prompt, token_tracker, max_tokens)
+            elif provider == "openai" and self.openai_client:
+                response = await self._call_openai(prompt, system_prompt, token_tracker, max_tokens)
+            elif provider == "anthropic" and self.anthropic_client:
+                response = await self._call_anthropic(prompt, system_prompt, token_tracker, max_tokens)
             else:
-                return "Bill Detail"  # Default
-        except Exception as e:
-            logger.error(f"Error detecting page type: {str(e)}")
-            return "Bill Detail"  # Default fallback
+                raise ValueError("No valid LLM provider configured")
+        
+        try:
+            payload = self._parse_json_response(response, payload_type)
+        except msgspec.DecodeError as e:
+            logger.error(f"JSON decode error: {str(e)}, Response: {response[:500]}")
+            raise
+        
+        response_cache.set(cache_key, response)
+        return payload
     
-    def extract_line_items(self, text: str, page_no: int) -> List[Dict[str, Any]]:
-        """Extract line items from bill text using LLM"""
-        system_prompt = """You are an expert at extracting structured data from medical bills and invoices.
-Extract ALL line items from the bill text. For each line item, extract:
-- item_name: The exact name/description as shown in the bill
-- item_amount: The net amount (after discounts) for this line item (float)
-- item_rate: The unit rate/price for this item (float)
-- item_quantity: The quantity of this item (float)
-
-IMPORTANT RULES:
-1. Extract EVERY line item - do not miss any
-2. Do NOT include subtotals or totals as line items
-3. item_amount should be the total for that line (quantity × rate, after discounts)
-4. If quantity is not explicitly mentioned, use 1.0
-5. If rate is not explicitly mentioned but amount and quantity are, calculate rate = amount / quantity
-6. Return ONLY valid JSON in this exact format (no markdown, no code blocks, just pure JSON):
-{
-  "bill_items": [
-    {
-      "item_name": "string",
-      "item_amount": 0.0,
-      "item_rate": 0.0,
-      "item_quantity": 1.0
-    }
-  ]
-}"""
+    def _normalize_page_type(self, page_type: Any) -> str:
+        """Map the model's page_type to one of the supported page types"""
+        page_type = str(page_type or "")
+        for candidate in PAGE_TYPES:
+            if candidate.lower() in page_type.lower():
+                return candidate
+        return DEFAULT_PAGE_TYPE
+    
+    def _parse_json_response(self, response: str, payload_type: Type[PayloadT]) -> PayloadT:
+        """Decode and validate JSON from an LLM response in a single pass"""
+        # Handle cases where response might have markdown code blocks
+        response = response.strip()
+        if response.startswith("```"):
+            # Remove markdown code blocks
+            response = _CODE_FENCE_RE.sub('', response)
         
-        prompt = f"""Extract all line items from this bill page. Return ONLY valid JSON in the exact format specified above, no additional text or markdown:\n\n{text}\n\nJSON:"""
+        # strict=False accepts numbers the model emits as strings, e.g. "120.50"
+        return msgspec.json.decode(response, type=payload_type, strict=False)
+    
+    def _clean_bill_items(self, items: List[BillItemPayload]) -> List[Dict[str, Any]]:
+        """Drop unnamed items, fill in missing values and convert decoded items to dicts"""
+        bill_items = []
+        for item in items:
+            name = item.item_name.strip()
+            if not name:
+                continue
+            
+            amount = item.item_amount if item.item_amount is not None else 0.0
+            quantity = item.item_quantity if item.item_quantity is not None else 1.0
+            # Derive a missing rate from amount / quantity, as the prompt asks the model to
+            rate = item.item_rate or (amount / quantity if quantity else 0.0)
+            bill_items.append({
+                "item_name": name,
+                "item_amount": amount,
+                "item_rate": rate,
+                "item_quantity": quantity
+            })
+        return bill_items
+    
+    async def process_page(
+        self, page_no: int, text: str, token_tracker: TokenTracker
+    ) -> Dict[str, Any]:
+        """Detect page type and extract line items from a single page in one LLM call"""
+        logger.info(f"Processing page {page_no}")
+        
+        prompt = f"""Classify this bill page and extract all line items. Return ONLY valid JSON in the exact format specified above, no additional text or markdown:\n\n{text}\n\nJSON:"""
         
+        page_type = DEFAULT_PAGE_TYPE
+        bill_items = []
         try:
-            response = self._call_llm(prompt, system_prompt)
-            
-            # Parse JSON response
-            # Handle cases where response might have markdown code blocks
-            response = response.strip()
-            if response.startswith("```"):
-                # Remove markdown code blocks
-                response = re.sub(r'^```json\s*', '', response)
-                response = re.sub(r'^```\s*', '', response)
-                response = re.sub(r'```\s*$', '', response)
-            
-            data = json.loads(response)
-            
-            # Validate and clean extracted items
-            bill_items = []
-            for item in data.get("bill_items", []):
-                # Ensure all required fields exist
-                if "item_name" in item and item["item_name"].strip():
-                    bill_items.append({
-                        "item_name": str(item["item_name"]).strip(),
-                        "item_amount": float(item.get("item_amount", 0.0)),
-                        "item_rate": float(item.get("item_rate", 0.0)),
-                        "item_quantity": float(item.get("item_quantity", 1.0))
-                    })
+            data = await self._call_llm(prompt, PAGE_SYSTEM_PROMPT, token_tracker, PagePayload)
             
+            page_type = self._normalize_page_type(data.page_type)
+            bill_items = self._clean_bill_items(data.bill_items)
+            logger.info(f"Page {page_no} detected as: {page_type}")
             logger.info(f"Extracted {len(bill_items)} line items from page {page_no}")
-            return bill_items
             
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {str(e)}, Response: {response[:500]}")
-            return []
         except Exception as e:
-            logger.error(f"Error extracting line items: {str(e)}")
-            return []
-    
-    def process_page(self, page_no: int, text: str) -> Dict[str, Any]:
-        """Process a single page and extract line items"""
-        logger.info(f"Processing page {page_no}")
-        
-        # Detect page type
-        page_type = self.detect_page_type(text)
-        logger.info(f"Page {page_no} detected as: {page_type}")
-        
-        # Extract line items
-        bill_items = self.extract_line_items(text, page_no)
+            logger.error(f"Error processing page {page_no}: {str(e)}")
         
         return {
             "page_no": str(page_no),
             "page_type": page_type,
             "bill_items": bill_items
         }
-
-
+    
+    async def process_pages(
+        self, pages: List[Tuple[int, str]], token_tracker: TokenTracker
+    ) -> List[Dict[str, Any]]:
+        """Process pages independently and concurrently, one LLM call per page"""
+        return list(await asyncio.gather(
+            *(self.process_page(page_no, text, token_tracker) for page_no, text in pages)
+        ))
+    
+    async def process_document_batched(
+        self, pages: List[Tuple[int, str]], token_tracker: TokenTracker
+    ) -> List[Dict[str, Any]]:
+        """
+        Process all pages of a document in a single LLM call.
+        Falls back to per-page calls when the batch is too large or the
+        batched response cannot be used.
+        """
+        if len(pages) <= 1 or len(pages) > config.BATCH_MAX_PAGES:
+            return await self.process_pages(pages, token_tracker)
+        
+        combined = "".join(
+            f"\n\n===PAGE {page_no}===\n\n{text}" for page_no, text in pages
+        )
+        page_tokens = TokenTracker.count_tokens_openai(combined)
+        input_tokens = BATCH_SYSTEM_PROMPT_TOKENS + page_tokens
+        if input_tokens > config.BATCH_MAX_INPUT_TOKENS:
+            logger.info(f"Batch of {len(pages)} pages is ~{input_tokens} tokens, processing per page")
+            return await self.process_pages(pages, token_tracker)
+        
+        # The JSON reply is usually several times longer than the page text it came from,
+        # so the completion budget is what limits a batch
+        max_tokens = config.BATCH_MAX_COMPLETION_TOKENS.get(config.DEFAULT_LLM_PROVIDER, 4096)
+        output_tokens = page_tokens * config.BATCH_OUTPUT_TOKEN_RATIO
+        if output_tokens > max_tokens:
+            logger.info(
+                f"Batch of {len(pages)} pages needs ~{output_tokens} output tokens, "
+                f"over the {max_tokens} budget, processing per page"
+            )
+            return await self.process_pages(pages, token_tracker)
+        
+        logger.info(f"Processing {len(pages)} pages in a single batch")
+        prompt = f"""Classify each bill page and extract all line items. Return ONLY valid JSON in the exact format specified above, no additional text or markdown:{combined}\n\nJSON:"""
+        
+        try:
+            data = await self._call_llm(
+                prompt, BATCH_SYSTEM_PROMPT, token_tracker, BatchPayload, max_tokens
+            )
+            batch_pages = {str(page.page_no): page for page in data.pages}
+        except Exception as e:
+            logger.error(f"Error processing batch: {str(e)}")
+            return await self.process_pages(pages, token_tracker)
+        
+        results = {}
+        for page_no, _ in pages:
+            page = batch_pages.get(str(page_no))
+            if page is None:
+                continue
+            results[page_no] = {
+                "page_no": str(page_no),
+                "page_type": self._normalize_page_type(page.page_type),
+                "bill_items": self._clean_bill_items(page.bill_items)
+            }
+            logger.info(f"Extracted {len(results[page_no]['bill_items'])} line items from page {page_no}")
+        
+        # Retry any pages the batched response missed individually
+        missing = [(page_no, text) for page_no, text in pages if page_no not in results]
+        if missing:
+            logger.warning(f"Batch response missing {len(missing)} pages, processing them individually")
+            for page_data in await self.process_pages(missing, token_tracker):
+                results[int(page_data["page_no"])] = page_data
+        
+        return [results[page_no] for page_no, _ in pages]
@@ -1,21 +1,61 @@
 """
 Document processing utilities for downloading and converting documents
 """
-import requests
+import asyncio
+import httpx
 import io
+import multiprocessing
 import os
 import shutil
-from PIL import Image
-from pdf2image import convert_from_bytes
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
+import fitz
 import pytesseract
 from typing import List, Tuple
 from utils.logger import logger
 import config
 
+# Header bytes of supported image formats: PNG, JPEG, TIFF (both byte orders), GIF and BMP.
+# WEBP is checked separately since its RIFF header carries the format at offset 8.
+IMAGE_SIGNATURES = (
+    b'\x89PNG',
+    b'\xff\xd8\xff',
+    b'II*\x00', b'MM\x00*',
+    b'GIF87a', b'GIF89a',
+    b'BM',
+)
+
+def _preprocess_for_ocr(image: Image.Image) -> Image.Image:
+    """Convert to a contrast-stretched 1-bit image so Tesseract has fewer bytes to process"""
+    gray = ImageOps.autocontrast(image.convert("L"))
+    threshold = config.OCR_BINARIZE_THRESHOLD
+    return gray.point(lambda p: 0 if p < threshold else 255, mode="1")
+
+def _init_ocr_worker():
+    """Limit each Tesseract run to one thread; the pool already provides the parallelism"""
+    # Inherited by the tesseract subprocess that pytesseract starts
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+def _ocr_worker(args: Tuple[Image.Image, str]) -> str:
+    """Run OCR on a single page in a worker process"""
+    image, tesseract_cmd = args
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return pytesseract.image_to_string(_preprocess_for_ocr(image), lang='eng')
+
 class DocumentProcessor:
     """Process documents from URLs - download, OCR, and extract text"""
     
     def __init__(self):
+        # Shared client so connections are reused across downloads
+        self.http_client = httpx.AsyncClient(timeout=30, http2=True, follow_redirects=True)
+        # One OCR pool per processor, reused across documents instead of started per request
+        self.ocr_executor = self._create_ocr_executor()
+        self._ocr_executor_lock = threading.Lock()
+        
+        # A missing Tesseract only matters once a page needs OCR; PDFs with a text layer don't
+        self.tesseract_error = None
         self.tesseract_cmd = self._find_tesseract()
         if self.tesseract_cmd:
             pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
@@ -25,15 +65,41 @@ class DocumentProcessor:
                 logger.info(f"Tesseract found at: {self.tesseract_cmd}")
             except Exception as e:
                 logger.error(f"Tesseract found but not accessible: {str(e)}")
-                raise RuntimeError(f"Tesseract is not accessible at {self.tesseract_cmd}. Please install Tesseract OCR.")
+                self.tesseract_error = f"Tesseract is not accessible at {self.tesseract_cmd}. Please install Tesseract OCR."
         else:
-            raise RuntimeError(
+            self.tesseract_error = (
                 "Tesseract OCR is not installed or not found in PATH. "
                 "Please install it:\n"
                 "  macOS: brew install tesseract\n"
                 "  Ubuntu: sudo apt-get install tesseract-ocr\n"
                 "  Windows: Download from https://github.com/UB-Mannheim/tesseract/wiki"
             )
+        
+        if self.tesseract_error:
+            logger.warning("OCR is unavailable, only PDFs with a text layer can be processed")
+    
+    def _create_ocr_executor(self) -> ProcessPoolExecutor:
+        """Create the process pool used for multi-page OCR"""
+        # Spawn rather than fork: the pool is started from a worker thread while the
+        # log listener and other threads are running
+        return ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker
+        )
+    
+    def _replace_broken_ocr_executor(self, broken: ProcessPoolExecutor):
+        """Swap in a new pool, unless another thread has already replaced the broken one"""
+        with self._ocr_executor_lock:
+            if self.ocr_executor is broken:
+                logger.warning("OCR process pool is broken, recreating it")
+                broken.shutdown(wait=False)
+                self.ocr_executor = self._create_ocr_executor()
+    
+    def _require_tesseract(self):
+        """Raise if OCR is needed but Tesseract is unavailable"""
+        if self.tesseract_error:
+            raise RuntimeError(self.tesseract_error)
     
     def _find_tesseract(self) -> str:
         """Find Tesseract installation path"""
@@ -55,14 +121,17 @@ class DocumentProcessor:
         
         return None
     
-    def download_document(self, url: str) -> bytes:
+    async def download_document(self, url: str) -> bytes:
         """Download document from URL"""
         try:
             logger.info(f"Downloading document from: {url}")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            logger.info(f"Successfully downloaded document, size: {len(response.content)} bytes")
-            return response.content
+            content = bytearray()
+            async with self.http_client.stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(65536):
+                    content.extend(chunk)
+            logger.info(f"Successfully downloaded document, size: {len(content)} bytes")
+            return bytes(content)
         except Exception as e:
             logger.error(f"Error downloading document: {str(e)}")
             raise
@@ -72,47 +141,105 @@ class DocumentProcessor:
         return content[:4] == b'%PDF'
     
     def is_image(self, content: bytes) -> bool:
-        """Check if content is an image"""
-        try:
-            Image.open(io.BytesIO(content))
-            return True
-        except:
-            return False
+        """Check if content is an image from its header bytes, without decoding it"""
+        if content[:4] == b'RIFF':
+            return content[8:12] == b'WEBP'
+        return content.startswith(IMAGE_SIGNATURES)
     
-    def pdf_to_images(self, pdf_content: bytes) -> List[Image.Image]:
-        """Convert PDF to list of PIL Images"""
+    def page_to_image(self, page: fitz.Page) -> Image.Image:
+        """Render a single PDF page to an 8-bit grayscale PIL Image"""
+        # OCR only needs luminance, so skip the 24-bit RGB buffer entirely
+        pixmap = page.get_pixmap(dpi=config.OCR_DPI, colorspace=fitz.csGRAY)
+        return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    
+    def pdf_to_text(self, pdf_content: bytes) -> List[str]:
+        """
+        Extract text from each PDF page, using the embedded text layer when
+        present and falling back to OCR only for pages without one
+        """
         try:
-            logger.info("Converting PDF to images")
-            images = convert_from_bytes(pdf_content, dpi=300)
-            logger.info(f"Converted PDF to {len(images)} pages")
-            return images
+            doc = fitz.open(stream=pdf_content, filetype="pdf")
         except Exception as e:
-            logger.error(f"Error converting PDF to images: {str(e)}")
+            logger.error(f"Error opening PDF: {str(e)}")
             raise
+        
+        try:
+            texts = [page.get_text("text") for page in doc]
+            scanned = [
+                idx for idx, text in enumerate(texts)
+                if len(text.strip()) < config.MIN_TEXT_LAYER_CHARS
+            ]
+            logger.info(
+                f"PDF has {len(texts)} pages, {len(texts) - len(scanned)} with a text layer"
+            )
+            
+            if scanned and self.tesseract_error:
+                # Keep whatever text layer these pages have; pages left empty are skipped later
+                logger.warning(
+                    "OCR is unavailable, using the text layer as-is for pages with "
+                    f"little or no text: {[idx + 1 for idx in scanned]}"
+                )
+            elif scanned:
+                logger.info(f"Rendering {len(scanned)} pages for OCR")
+                images = [self.page_to_image(doc[idx]) for idx in scanned]
+                for idx, text in zip(scanned, self.images_to_text(images)):
+                    texts[idx] = text
+            
+            return texts
+        finally:
+            doc.close()
     
     def image_to_text(self, image: Image.Image) -> str:
         """Extract text from image using OCR"""
+        self._require_tesseract()
         try:
-            text = pytesseract.image_to_string(image, lang='eng')
+            text = pytesseract.image_to_string(_preprocess_for_ocr(image), lang='eng')
             return text
         except Exception as e:
             logger.error(f"Error in OCR: {str(e)}")
             raise
     
-    def process_document(self, url: str) -> List[Tuple[int, str]]:
+    def images_to_text(self, images: List[Image.Image]) -> List[str]:
+        """Extract text from multiple images, running OCR in parallel processes"""
+        self._require_tesseract()
+        if len(images) <= 1:
+            return [self.image_to_text(image) for image in images]
+        
+        logger.info(f"Running OCR on {len(images)} pages in the process pool")
+        args = [(image, self.tesseract_cmd) for image in images]
+        try:
+            executor = self.ocr_executor
+            try:
+                return list(executor.map(_ocr_worker, args))
+            except BrokenProcessPool:
+                # A worker died, which leaves the pool unusable; rebuild it and retry once
+                self._replace_broken_ocr_executor(executor)
+                return list(self.ocr_executor.map(_ocr_worker, args))
+        except Exception as e:
+            logger.error(f"Error in OCR: {str(e)}")
+            raise
+    
+    async def close(self):
+        """Close the download client and stop the OCR worker processes"""
+        await self.http_client.aclose()
+        self.ocr_executor.shutdown()
+    
+    async def process_document(self, url: str) -> List[Tuple[int, str]]:
         """
         Process document from URL and return list of (page_number, text) tuples
         Returns: List of (page_no, text) tuples
         """
-        content = self.download_document(url)
+        content = await self.download_document(url)
+        # Text extraction and OCR block, so keep them off the event loop
+        return await asyncio.to_thread(self.extract_pages, content)
+    
+    def extract_pages(self, content: bytes) -> List[Tuple[int, str]]:
+        """Extract (page_no, text) tuples from downloaded document content"""
         pages = []
         
         if self.is_pdf(content):
-            images = self.pdf_to_images(content)
-            for idx, image in enumerate(images, start=1):
-                logger.info(f"Processing page {idx} of PDF")
-                text = self.image_to_text(image)
-                pages.append((idx, text))
+            texts = self.pdf_to_text(content)
+            pages = list(enumerate(texts, start=1))
         elif self.is_image(content):
             logger.info("Processing single image document")
             image = Image.open(io.BytesIO(content))
@@ -1,11 +1,15 @@
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 
 def setup_logger(name="bill_extraction"):
-    """Setup logger with file and console handlers"""
+    """Setup logger with file and console handlers fed through a background queue"""
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
+    logger.propagate = False
     
     # Create logs directory if it doesn't exist
     os.makedirs("logs", exist_ok=True)
@@ -27,8 +31,15 @@ def setup_logger(name="bill_extraction"):
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
     
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Callers only enqueue records; a listener thread performs the actual writes
+    log_queue = queue.Queue(-1)
+    listener = QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
@@ -0,0 +1,52 @@
+"""
+In-memory cache for LLM responses keyed by prompt hash
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class ResponseCache:
+    """Exact-match LRU cache for LLM responses with time-based expiry"""
+    
+    def __init__(self, max_size: int = 1024, ttl: int = 86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Build a cache key from the prompt components"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: str):
+        """Store a response, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+        
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Remove all cached responses"""
+        self._entries.clear()
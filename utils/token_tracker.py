@@ -1,12 +1,16 @@
 """
 Token usage tracking utility for LLM API calls
 """
-from typing import Dict
+import os
+from typing import Dict, List
 import tiktoken
 
 class TokenTracker:
     """Track token usage across all LLM calls"""
     
+    # Encoders are expensive to look up, so load each one once per process
+    _encodings: Dict[str, tiktoken.Encoding] = {}
+    
     def __init__(self):
         self.total_tokens = 0
         self.input_tokens = 0
@@ -32,23 +36,41 @@ class TokenTracker:
         self.input_tokens = 0
         self.output_tokens = 0
     
-    @staticmethod
-    def count_tokens_openai(text: str, model: str = "gpt-4") -> int:
+    @classmethod
+    def _get_encoding(cls, model: str) -> tiktoken.Encoding:
+        """Get the cached tiktoken encoding for a model"""
+        encoding = cls._encodings.get(model)
+        if encoding is None:
+            encoding = tiktoken.encoding_for_model(model)
+            cls._encodings[model] = encoding
+        return encoding
+    
+    @classmethod
+    def count_tokens_openai(cls, text: str, model: str = "gpt-4") -> int:
         """Count tokens for OpenAI models"""
         try:
-            encoding = tiktoken.encoding_for_model(model)
-            return len(encoding.encode(text))
+            return len(cls._get_encoding(model).encode(text))
         except:
             # Fallback: approximate token count (1 token ≈ 4 characters)
             return len(text) // 4
     
-    @staticmethod
-    def count_tokens_anthropic(text: str) -> int:
+    @classmethod
+    def count_tokens_batch(cls, texts: List[str], model: str = "gpt-4") -> List[int]:
+        """Count tokens for several texts at once, encoding them in parallel threads"""
+        try:
+            encoded = cls._get_encoding(model).encode_batch(
+                texts, num_threads=min(8, os.cpu_count() or 1)
+            )
+            return [len(tokens) for tokens in encoded]
+        except:
+            return [len(text) // 4 for text in texts]
+    
+    @classmethod
+    def count_tokens_anthropic(cls, text: str) -> int:
         """Count tokens for Anthropic models (approximate)"""
-        # Anthropic uses a different tokenizer, approximate with tiktoken
+        # Anthropic uses a different tokenizer, approximate with the cl100k_base encoding of gpt-4
         try:
-            encoding = tiktoken.get_encoding("cl100k_base")
-            return len(encoding.encode(text))
+            return len(cls._get_encoding("gpt-4").encode(text))
         except:
             return len(text) // 4
 